@@ -1,7 +1,12 @@
+# connectors/meta/meta_ads_current.py
+# pip install "httpx[http2]" orjson python-dotenv
+
 import os
-import json
+import time
 import argparse
-import requests
+import httpx
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
@@ -14,19 +19,32 @@ GRAPH_BASE = f"https://graph.facebook.com/{META_API_VERSION}"
 GRAPH_BASE_NO_VER = "https://graph.facebook.com"  # debug_token은 버전 없이도 동작
 
 # 구매 액션 타입 후보 (계정/픽셀 세팅에 따라 다를 수 있어 넓게 잡음)
-PURCHASE_ACTION_KEYS = {
+# (".purchase"로 끝나는 타입은 접미사 검사로 잡히므로 여기엔 그 외 타입만 둠)
+PURCHASE_ACTION_KEYS = frozenset({
     "purchase",
     "omni_purchase",
-    "offsite_conversion.purchase",
     "web_in_store_purchase",
-    "onsite_conversion.purchase",
-}
+})
 
 NEEDED_PERMS = {"ads_read", "read_insights"}  # 필수급
 NICE_TO_HAVE_PERMS = {"ads_management"}       # 있으면 좋은
 
 TIMEOUT = 30
 
+# ✅ 같은 graph.facebook.com 호스트로 여러 번 호출하므로 HTTP/2 클라이언트 하나로 연결 재사용
+#    (프로필 스레드들의 요청이 커넥션 1개 위에서 멀티플렉싱됨)
+CLIENT = httpx.Client(
+    timeout=TIMEOUT,
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=8),
+        retries=3,  # 연결 실패 재시도
+    ),
+)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_TOTAL = 3
+RETRY_BACKOFF_SEC = 0.3
+
 
 # -----------------------
 # Helpers
@@ -49,39 +67,37 @@ def normalize_act_id(ad_account_id: str) -> str:
         return ""
     return ad_account_id if ad_account_id.startswith("act_") else f"act_{ad_account_id}"
 
-def safe_json(resp: requests.Response):
+def safe_json(resp: httpx.Response):
     try:
-        return resp.json()
+        return orjson.loads(resp.content)
     except Exception:
         return None
 
-def http_get(url: str, params: dict, label: str):
-    r = requests.get(url, params=params, timeout=TIMEOUT)
-    data = safe_json(r)
-    if r.status_code != 200:
-        raise RuntimeError(
-            f"[HTTP ERROR] {label}\n"
-            f"  url: {url}\n"
-            f"  status: {r.status_code}\n"
-            f"  body: {data or r.text[:300]}"
-        )
-    return data
+def send(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    CLIENT로 요청. 429/5xx면 짧게 backoff 하며 재시도하고,
+    끝까지 실패하면 마지막 응답을 그대로 반환(기존 에러 메시지로 처리).
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        r = CLIENT.request(method, url, **kwargs)
+        if r.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            return r
+        time.sleep(RETRY_BACKOFF_SEC * (2 ** attempt))
+    return r
 
 def parse_purchases_from_actions(actions) -> int:
     if not actions:
         return 0
     total = 0
     for a in actions:
-        at = (a.get("action_type") or "").strip()
-        val = a.get("value")
-        if val is None:
-            continue
-
-        is_purchase = (at in PURCHASE_ACTION_KEYS) or at.endswith(".purchase")
-        if is_purchase:
+        at = a.get("action_type") or ""
+        if at in PURCHASE_ACTION_KEYS or at.endswith(".purchase"):
+            val = a.get("value")
+            if val is None:
+                continue
             try:
                 total += int(float(val))
-            except ValueError:
+            except (ValueError, TypeError):
                 pass
     return total
 
@@ -89,30 +105,58 @@ def parse_purchases_from_actions(actions) -> int:
 # -----------------------
 # Preflight checks
 # -----------------------
-def debug_token(access_token: str) -> dict:
+def preflight_batch(access_token: str, limit: int = 200) -> tuple[tuple, tuple, tuple]:
     """
-    토큰이 유효한지/만료인지/앱ID/타입 등을 확인.
+    debug_token / me/permissions / me/adaccounts 3개를 Graph API batch 요청 1번으로 조회.
+    - debug_token: 토큰이 유효한지/만료인지/앱ID/타입 등을 확인
+    - me/permissions: granted/declined 확인
+    - me/adaccounts: 이 토큰이 접근 가능한 광고계정 목록
+      (시스템 사용자 토큰이면 여기 목록이 '실제로 할당된' 계정들)
+    반환: debug_token / permissions / adaccounts 각각의 (status code, body)
+    (항목별 HTTP 에러는 여기서 raise하지 않음 → preflight가 순서대로 확인하며 구체적인 원인을 먼저 출력)
     """
-    url = f"{GRAPH_BASE_NO_VER}/debug_token"
-    params = {"input_token": access_token, "access_token": access_token}
-    return http_get(url, params, label="debug_token")
+    batch = [
+        {"method": "GET", "relative_url": f"debug_token?input_token={access_token}"},
+        {"method": "GET", "relative_url": f"{META_API_VERSION}/me/permissions"},
+        {
+            "method": "GET",
+            "relative_url": f"{META_API_VERSION}/me/adaccounts?fields=account_id,name,account_status&limit={limit}",
+        },
+    ]
+    data = {"access_token": access_token, "batch": orjson.dumps(batch).decode()}
 
-def get_permissions(access_token: str) -> dict:
-    """
-    /me/permissions 로 granted/declined 확인
-    """
-    url = f"{GRAPH_BASE}/me/permissions"
-    params = {"access_token": access_token}
-    return http_get(url, params, label="me/permissions")
+    r = send("POST", GRAPH_BASE_NO_VER, data=data)
+    payload = safe_json(r)
+    if r.status_code != 200 or not isinstance(payload, list) or len(payload) != len(batch):
+        raise RuntimeError(
+            f"[HTTP ERROR] preflight batch\n"
+            f"  url: {GRAPH_BASE_NO_VER}\n"
+            f"  status: {r.status_code}\n"
+            f"  body: {payload or r.text[:300]}"
+        )
 
-def list_my_adaccounts(access_token: str, limit: int = 200) -> dict:
-    """
-    이 토큰이 접근 가능한 광고계정 목록을 가져옴.
-    시스템 사용자 토큰이면 여기 목록이 '실제로 할당된' 계정들.
-    """
-    url = f"{GRAPH_BASE}/me/adaccounts"
-    params = {"access_token": access_token, "fields": "account_id,name,account_status", "limit": limit}
-    return http_get(url, params, label="me/adaccounts")
+    # batch 응답은 [{code, headers, body(JSON 문자열)}, ...] 형태 (타임아웃된 항목은 null)
+    out = []
+    for item in payload:
+        code = (item or {}).get("code")
+        body_text = (item or {}).get("body") or ""
+        try:
+            body = orjson.loads(body_text) if body_text else None
+        except ValueError:
+            body = None
+        out.append((code, body or body_text[:300]))
+    return out[0], out[1], out[2]
+
+def batch_item_body(label: str, item: tuple) -> dict:
+    """preflight_batch 항목 1개: 200이 아니면 [HTTP ERROR], 맞으면 body(dict) 반환"""
+    code, body = item
+    if code != 200:
+        raise RuntimeError(
+            f"[HTTP ERROR] {label} (batch)\n"
+            f"  status: {code}\n"
+            f"  body: {body}"
+        )
+    return body if isinstance(body, dict) else {}
 
 def summarize_permissions(perms_payload: dict):
     granted = set()
@@ -132,12 +176,16 @@ def summarize_permissions(perms_payload: dict):
 def preflight(profile_name: str, token: str, target_act: str):
     """
     문제를 '권한 누락' vs '자산 할당/접근 불가'로 분리해주는 사전 점검.
+    (--preflight 요청 시 / 인사이트 권한 오류 시에만 실행되므로 항상 실제로 점검)
     """
     print(f"\n[PRECHECK] {profile_name}")
     print(f"  target ad account: {target_act}")
 
+    # ✅ 3개 사전 점검 API를 batch 1회 왕복으로 조회
+    dbg_item, perms_item, adacc_item = preflight_batch(token, limit=200)
+
     # 1) debug_token
-    dbg = debug_token(token)
+    dbg = batch_item_body("debug_token", dbg_item)
     dbg_data = (dbg.get("data") or {})
     is_valid = dbg_data.get("is_valid")
     expires_at = dbg_data.get("expires_at")
@@ -153,7 +201,7 @@ def preflight(profile_name: str, token: str, target_act: str):
         )
 
     # 2) permissions
-    perms_payload = get_permissions(token)
+    perms_payload = batch_item_body("me/permissions", perms_item)
     granted, declined = summarize_permissions(perms_payload)
 
     missing_needed = sorted(list(NEEDED_PERMS - granted))
@@ -172,8 +220,8 @@ def preflight(profile_name: str, token: str, target_act: str):
     if missing_nice:
         print(f"  ⚠️ missing optional perms: {', '.join(missing_nice)} (있으면 편함)")
 
-    # 3) accessible ad accounts check
-    adacc_payload = list_my_adaccounts(token, limit=200)
+    # 3) accessible ad accounts check (권한 누락이면 위에서 이미 [PERMISSION MISSING]으로 끝남)
+    adacc_payload = batch_item_body("me/adaccounts", adacc_item)
     adaccs = adacc_payload.get("data") or []
     accessible = set()
     for a in adaccs:
@@ -207,11 +255,15 @@ def preflight(profile_name: str, token: str, target_act: str):
 # -----------------------
 # Insights fetch (CURRENT spend)
 # -----------------------
+class InsightsPermissionError(RuntimeError):
+    """Insights가 HTTP 403 + (#200) 으로 거부됨 → preflight로 원인 진단 대상"""
+
+
 def fetch_insights_current_spend(access_token: str, ad_account_id: str, ymd: str) -> dict:
     """
     '현재 광고비' = 오늘(KST) 00:00 ~ 현재까지 누적 spend
     - Insights는 time_range since=ymd, until=ymd 로 요청하면 보통 그 날짜 누적(진행중)을 반환
-    - 혹시 여러 row가 오면(시간 분할/특이 케이스) date_start==ymd 인 것만 합산
+    - time_increment 없이 since==until 로 요청하면 집계된 row 1개만 옴
     """
     act_id = normalize_act_id(ad_account_id)
     url = f"{GRAPH_BASE}/{act_id}/insights"
@@ -220,12 +272,10 @@ def fetch_insights_current_spend(access_token: str, ad_account_id: str, ymd: str
         "access_token": access_token,
         "fields": "spend,actions,date_start,date_stop",
         "level": "account",
-        "time_range": json.dumps({"since": ymd, "until": ymd}),
-        "time_increment": 1,  # 하루 단위 row로 받기
-        "limit": 100,
+        "time_range": orjson.dumps({"since": ymd, "until": ymd}).decode(),
     }
 
-    r = requests.get(url, params=params, timeout=TIMEOUT)
+    r = send("GET", url, params=params)
     data = safe_json(r)
 
     if r.status_code != 200:
@@ -234,7 +284,9 @@ def fetch_insights_current_spend(access_token: str, ad_account_id: str, ymd: str
         code = err.get("code") if isinstance(err, dict) else None
 
         hint = ""
+        err_cls = RuntimeError
         if r.status_code == 403 and code == 200:
+            err_cls = InsightsPermissionError
             hint = (
                 "\n[HINT]\n"
                 "- (#200) 권한/자산할당 문제일 확률이 높습니다.\n"
@@ -242,7 +294,7 @@ def fetch_insights_current_spend(access_token: str, ad_account_id: str, ymd: str
                 "- 토큰 permissions에 ads_read/read_insights가 granted인지 확인하세요.\n"
             )
 
-        raise RuntimeError(
+        raise err_cls(
             f"[INSIGHTS FAIL] {act_id}\n"
             f"  HTTP {r.status_code}\n"
             f"  error_message: {msg}\n"
@@ -254,33 +306,27 @@ def fetch_insights_current_spend(access_token: str, ad_account_id: str, ymd: str
     if not rows:
         return {"date": ymd, "spend": 0.0, "purchases": 0, "raw": data}
 
-    spend_sum = 0.0
-    purchases_sum = 0
-
-    for row in rows:
-        # 혹시라도 date_start/date_stop이 섞여오면 오늘 row만 합산
-        ds = (row.get("date_start") or "").strip()
-        if ds and ds != ymd:
-            continue
-
-        try:
-            spend_sum += float(row.get("spend") or 0.0)
-        except ValueError:
-            pass
+    row = rows[0]
 
-        purchases_sum += parse_purchases_from_actions(row.get("actions"))
+    try:
+        spend = float(row.get("spend") or 0.0)
+    except ValueError:
+        spend = 0.0
 
-    return {"date": ymd, "spend": float(spend_sum), "purchases": int(purchases_sum), "raw": rows[0]}
+    purchases = parse_purchases_from_actions(row.get("actions"))
 
+    return {"date": ymd, "spend": spend, "purchases": int(purchases), "raw": row}
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--date", type=str, default="", help="YYYY-MM-DD (기본: 오늘 KST)")
-    parser.add_argument("--json", action="store_true", help="마지막 줄에 JSON 결과만 출력")
-    args = parser.parse_args()
 
+def run_meta(target_ymd: str = "", force_preflight: bool = False) -> dict:
+    """
+    ✅ runner에서 import 해서 바로 호출하는 용도 (서브프로세스 없이)
+    - 사전 점검(preflight)은 인사이트가 (#200) 403으로 실패했을 때만 원인 진단용으로 실행
+      (force_preflight=True면 조회 전에 항상 실행)
+    반환: {"date", "mapped": {brand: {spend, purchases}}, "total": {spend, purchases}}
+    """
     # ✅ 변경: 기본값을 '오늘(KST)'로 = 현재 광고비
-    target_ymd = (args.date or "").strip() or ymd_today_kst()
+    target_ymd = (target_ymd or "").strip() or ymd_today_kst()
 
     profiles = [
         {
@@ -298,29 +344,40 @@ def main():
     print(f"[INFO] Meta Ads CURRENT (KST): {target_ymd} | API={META_API_VERSION}")
     print("=" * 70)
 
-    mapped = {}
-    total_spend = 0.0
-    total_purchases = 0
-
-    for p in profiles:
+    def run_profile(p: dict):
         target_act = normalize_act_id(p["ad_account"])
 
-        # ✅ 사전 점검
-        preflight(p["name"], p["token"], target_act)
+        # ✅ 사전 점검 (요청한 경우만)
+        if force_preflight:
+            preflight(p["name"], p["token"], target_act)
+
+        # ✅ 현재(오늘 누적) 인사이트 조회 → 권한 문제로 실패하면 그때 사전 점검으로 원인 출력
+        try:
+            res = fetch_insights_current_spend(p["token"], p["ad_account"], target_ymd)
+        except InsightsPermissionError:
+            preflight(p["name"], p["token"], target_act)
+            raise
+        return p["name"], target_act, res
 
-        # ✅ 현재(오늘 누적) 인사이트 조회
-        res = fetch_insights_current_spend(p["token"], p["ad_account"], target_ymd)
+    # ✅ 프로필끼리는 서로 독립이므로 병렬로 조회 (출력은 아래에서 프로필 순서대로)
+    with ThreadPoolExecutor(max_workers=len(profiles)) as ex:
+        results = list(ex.map(run_profile, profiles))
 
+    mapped = {}
+    total_spend = 0.0
+    total_purchases = 0
+
+    for name, target_act, res in results:
         total_spend += res["spend"]
         total_purchases += res["purchases"]
 
-        mapped[p["name"]] = {
+        mapped[name] = {
             "date": target_ymd,
             "spend": res["spend"],
             "purchases": res["purchases"],
         }
 
-        print(f"\n[RESULT] {p['name']} ({target_act})")
+        print(f"\n[RESULT] {name} ({target_act})")
         print(f"  spend(current): {res['spend']}")
         print(f"  purchases(current): {res['purchases']}")
         print("-" * 70)
@@ -330,17 +387,28 @@ def main():
     print(f"  total_purchases(current): {total_purchases}")
     print("=" * 70)
 
+    return {
+        "date": target_ymd,
+        "mapped": {
+            "burdenzero": mapped.get("burdenzero", {"spend": 0.0, "purchases": 0}),
+            "brainology": mapped.get("brainology", {"spend": 0.0, "purchases": 0}),
+        },
+        "total": {"spend": float(total_spend), "purchases": int(total_purchases)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--date", type=str, default="", help="YYYY-MM-DD (기본: 오늘 KST)")
+    parser.add_argument("--json", action="store_true", help="마지막 줄에 JSON 결과만 출력")
+    parser.add_argument("--preflight", action="store_true", help="조회 전에 토큰/권한/광고계정 사전 점검 실행")
+    args = parser.parse_args()
+
+    out = run_meta(args.date, force_preflight=args.preflight)
+
     # ✅ runner가 파싱할 마지막 줄 JSON 출력
     if args.json:
-        out = {
-            "date": target_ymd,
-            "mapped": {
-                "burdenzero": mapped.get("burdenzero", {"spend": 0.0, "purchases": 0}),
-                "brainology": mapped.get("brainology", {"spend": 0.0, "purchases": 0}),
-            },
-            "total": {"spend": float(total_spend), "purchases": int(total_purchases)},
-        }
-        print(json.dumps(out, ensure_ascii=False))
+        print(orjson.dumps(out).decode())
 
 
 if __name__ == "__main__":
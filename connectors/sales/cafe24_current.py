@@ -4,6 +4,9 @@ import re
 import time
 import json
 import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
@@ -14,24 +17,78 @@ load_dotenv()
 KST = timezone(timedelta(hours=9))
 TIMEOUT = 20_000  # 빠르게
 
+# ✅ 로그인 세션(쿠키/localStorage) 캐시: 유효하면 로그인 과정 생략
+STORAGE_STATE_MAX_AGE_SEC = 24 * 3600
+
+# ✅ 프로필 1개 조회 전체(로그인~대시보드)의 최대 대기 시간. 각 goto/wait는 남은 시간 안에서만 기다리고, 넘기면 바로 실패
+DEADLINE_SEC = int(os.getenv("CAFE24_DEADLINE_SEC", "45"))
+
+# ✅ 스크래핑에 필요 없는 리소스는 받지 않음 (대시보드 로딩 단축)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS_RE = re.compile(
+    r"^https?://([^/?#]*\.)?(doubleclick\.net|googletagmanager\.com|google-analytics\.com|facebook\.net|hotjar\.com"
+    r"|criteo\.(com|net)|mixpanel\.com|segment\.(io|com))(:\d+)?([/?#]|$)"
+)
+CHROMIUM_ARGS = ["--disable-dev-shm-usage", "--disable-blink-features=AutomationControlled"]
+
+_WS_RE = re.compile(r"\s+")
+_NUM_RE = re.compile(r"\d[\d,]*")
+
 
 # ---------------------------
-# Helpers
+# Config (import 시점에 CAFE24_* 환경변수를 한 번만 읽어둠)
 # ---------------------------
-def must_env(key: str) -> str:
-    v = os.getenv(key, "").strip()
-    if not v:
-        raise RuntimeError(f"{key} 환경변수가 필요합니다. .env를 확인하세요.")
-    return v
+@dataclass(frozen=True)
+class Cafe24Config:
+    profiles: dict  # {"BRAINOLOGY": {"ADMIN_URL": ..., "ADMIN_ID": ..., ...}, ...}
+    post_login_wait_ms: int
+
+
+def _load_config() -> Cafe24Config:
+    profiles: dict = {}
+    for key, val in os.environ.items():
+        if not key.startswith("CAFE24_"):
+            continue
+        val = val.strip()
+        parts = key[len("CAFE24_"):].split("_", 1)
+        if len(parts) != 2 or not val:
+            continue
+        profiles.setdefault(parts[0], {})[parts[1]] = val
+
+    return Cafe24Config(
+        profiles=profiles,
+        post_login_wait_ms=int(os.getenv("CAFE24_POST_LOGIN_WAIT_MS", "300").strip() or 300),
+    )
+
+
+CONFIG = _load_config()
 
 
+# ---------------------------
+# Helpers
+# ---------------------------
 def must_env_profile(profile: str, suffix: str) -> str:
     p = profile.strip().upper()
-    return must_env(f"CAFE24_{p}_{suffix}")
+    try:
+        return CONFIG.profiles[p][suffix]
+    except KeyError:
+        raise RuntimeError(f"CAFE24_{p}_{suffix} 환경변수가 필요합니다. .env를 확인하세요.") from None
+
+
+def remaining_ms(deadline: float, cap: int | None = None) -> int:
+    """
+    deadline(time.monotonic 기준)까지 남은 ms (cap이 있으면 그 이하).
+    이미 지났으면 더 기다리지 않고 바로 RuntimeError.
+    """
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise RuntimeError(f"제한 시간({DEADLINE_SEC}초)을 초과했습니다. (CAFE24_DEADLINE_SEC)")
+    ms = max(1, int(left * 1000))
+    return min(ms, cap) if cap else ms
 
 
 def normalize_text(text: str) -> str:
-    return re.sub(r"\s+", " ", (text or "")).strip()
+    return _WS_RE.sub(" ", (text or "")).strip()
 
 
 def save_debug(page, prefix: str = "fail") -> None:
@@ -47,7 +104,7 @@ def parse_two_numbers(raw: str) -> tuple[int, int]:
     -> 첫 숫자=매출, 두번째 숫자=주문수
     """
     raw = normalize_text(raw)
-    nums = re.findall(r"\d[\d,]*", raw)
+    nums = _NUM_RE.findall(raw)
     if len(nums) < 2:
         raise ValueError(f"텍스트에서 숫자 2개(매출/주문수)를 파싱하지 못했습니다: {raw}")
     sales = int(nums[0].replace(",", ""))
@@ -58,69 +115,88 @@ def parse_two_numbers(raw: str) -> tuple[int, int]:
 # ---------------------------
 # Cafe24 flow
 # ---------------------------
-def login_cafe24(page, profile: str) -> None:
+LOGIN_ID_SELECTOR = (
+    "input[name='id'], input#id, input[name='mall_id'], input[type='text'], "
+    "input[placeholder*='아이디'], input[placeholder*='ID']"
+)
+LOGIN_PW_SELECTOR = (
+    "input[name='passwd'], input#passwd, input[name='password'], input[type='password'], "
+    "input[placeholder*='비밀번호'], input[placeholder*='Password']"
+)
+LOGIN_BTN_SELECTOR = "button:has-text('로그인'), [role='button']:has-text('로그인'), input[value*='로그인']"
+
+# 숨겨진 폼(다른 탭/레이어의 input 등)을 잡지 않도록 화면에 보이는 요소만
+VISIBLE = " >> visible=true"
+
+
+def find_login_scope(page, timeout: int = 5_000):
+    """
+    로그인 폼이 있는 scope(page 또는 iframe) 반환. 못 찾으면 None.
+    - 메인 페이지: 잠깐(최대 1초) wait_for_selector로 폼이 보이는 순간 바로 반환
+    - 없으면 남은 시간 동안 모든 frame을 짧게 주기적으로 확인 (늦게 뜨는 iframe 로그인 폼 대응)
+    - 아이디/비밀번호 칸이 모두 화면에 보이는 scope만 인정
+    """
+    deadline = time.monotonic() + timeout / 1000
+    try:
+        page.wait_for_selector(LOGIN_PW_SELECTOR, state="visible", timeout=min(timeout, 1_000))
+        if page.locator(LOGIN_ID_SELECTOR + VISIBLE).count() > 0:
+            return page
+    except PwTimeoutError:
+        pass
+
+    while True:
+        for frame in page.frames:
+            try:
+                if (
+                    frame.locator(LOGIN_PW_SELECTOR + VISIBLE).count() > 0
+                    and frame.locator(LOGIN_ID_SELECTOR + VISIBLE).count() > 0
+                ):
+                    return page if frame == page.main_frame else frame
+            except Exception:
+                continue
+        if time.monotonic() >= deadline:
+            return None
+        page.wait_for_timeout(200)
+
+
+def login_cafe24(page, profile: str, deadline: float | None = None) -> None:
+    if deadline is None:
+        deadline = time.monotonic() + DEADLINE_SEC
+
     url = must_env_profile(profile, "ADMIN_URL")
     user = must_env_profile(profile, "ADMIN_ID")
     pw = must_env_profile(profile, "ADMIN_PW")
 
     # ✅ 로그인 페이지는 충분히 로드되게(최대 5초 정도) 보수적으로 대기
-    page.goto(url, wait_until="domcontentloaded")
+    page.goto(url, wait_until="domcontentloaded", timeout=remaining_ms(deadline, TIMEOUT))
     try:
-        page.wait_for_load_state("load", timeout=5_000)
+        page.wait_for_load_state("load", timeout=remaining_ms(deadline, 5_000))
     except PwTimeoutError:
         pass
-    time.sleep(1.0)  # 잔여 렌더/스크립트 안정화
 
-    scopes = [page] + list(page.frames)
-
-    # ✅ 로그인 폼이 실제로 나타날 때까지 최대 5초 폴링
-    deadline = time.time() + 5.0
+    # ✅ 로그인 폼이 실제로 나타날 때까지 브라우저 안에서 대기 (Python 폴링 X)
     submitted = False
     last_err = None
 
-    while time.time() < deadline and not submitted:
-        for scope in scopes:
-            try:
-                id_loc = scope.locator(
-                    "input[name='id'], input#id, input[name='mall_id'], input[type='text'], "
-                    "input[placeholder*='아이디'], input[placeholder*='ID']"
-                )
-                pw_loc = scope.locator(
-                    "input[name='passwd'], input#passwd, input[name='password'], input[type='password'], "
-                    "input[placeholder*='비밀번호'], input[placeholder*='Password']"
-                )
-
-                if id_loc.count() == 0 or pw_loc.count() == 0:
-                    continue
-
-                # 입력 가능 상태까지 짧게 대기
-                try:
-                    id_loc.first.wait_for(state="visible", timeout=1_000)
-                    pw_loc.first.wait_for(state="visible", timeout=1_000)
-                except Exception:
-                    continue
-
-                id_loc.first.fill(user)
-                pw_loc.first.fill(pw)
-
-                btn = scope.locator(
-                    "button:has-text('로그인'), [role='button']:has-text('로그인'), input[value*='로그인']"
-                )
-                if btn.count() > 0:
-                    btn.first.click()
-                    submitted = True
-                    break
-
-                pw_loc.first.press("Enter")
-                submitted = True
-                break
-
-            except Exception as e:
-                last_err = e
-                continue
-
-        if not submitted:
-            time.sleep(0.25)
+    scope = find_login_scope(page, timeout=remaining_ms(deadline, 5_000))
+    login_page_url = page.url
+    if scope is not None:
+        try:
+            id_loc = scope.locator(LOGIN_ID_SELECTOR + VISIBLE).first
+            pw_loc = scope.locator(LOGIN_PW_SELECTOR + VISIBLE).first
+
+            # ✅ 입력/클릭도 기본 TIMEOUT(20초)이 아니라 남은 시간 안에서만
+            id_loc.fill(user, timeout=remaining_ms(deadline, TIMEOUT))
+            pw_loc.fill(pw, timeout=remaining_ms(deadline, TIMEOUT))
+
+            btn = scope.locator(LOGIN_BTN_SELECTOR + VISIBLE)
+            if btn.count() > 0:
+                btn.first.click(timeout=remaining_ms(deadline, TIMEOUT))
+            else:
+                pw_loc.press("Enter", timeout=remaining_ms(deadline, TIMEOUT))
+            submitted = True
+        except Exception as e:
+            last_err = e
 
     if not submitted:
         save_debug(page, f"{profile}_login_form_not_found")
@@ -129,10 +205,16 @@ def login_cafe24(page, profile: str) -> None:
             f"debug/{profile}_login_form_not_found.* 확인 (last_err={last_err})"
         )
 
-    time.sleep(4)
+    # ✅ 고정 sleep 대신: 제출 전 URL에서 벗어나는 순간 바로 진행
+    # (ADMIN_URL에 "login"이 없어도 로그인 POST가 끝나기 전에 넘어가지 않도록 URL 변화 자체를 기다림)
+    try:
+        page.wait_for_url(lambda u: u != login_page_url, timeout=remaining_ms(deadline, 10_000))
+    except PwTimeoutError:
+        pass
+
     # ✅ 로그인 후: 다음 페이지로 실제 넘어갔는지 확인 (최대 10초)
     try:
-        page.wait_for_load_state("domcontentloaded", timeout=10_000)
+        page.wait_for_load_state("domcontentloaded", timeout=remaining_ms(deadline, 10_000))
     except PwTimeoutError:
         pass
 
@@ -151,20 +233,17 @@ def login_cafe24(page, profile: str) -> None:
 
 def wait_after_login(page, profile: str) -> None:
     # networkidle은 느려질 수 있어서 최소 대기만
-    try:
-        page.wait_for_load_state("domcontentloaded", timeout=10_000)
-    except PwTimeoutError:
-        pass
-
-    wait_ms_key = f"CAFE24_{profile.strip().upper()}_POST_LOGIN_WAIT_MS"
-    wait_ms = int(os.getenv(wait_ms_key, os.getenv("CAFE24_POST_LOGIN_WAIT_MS", "300")))
+    # (domcontentloaded 대기는 login_cafe24 끝에서 이미 함)
+    profile_cfg = CONFIG.profiles.get(profile.strip().upper()) or {}
+    wait_ms = int(profile_cfg.get("POST_LOGIN_WAIT_MS") or CONFIG.post_login_wait_ms)
     if wait_ms > 0:
         time.sleep(wait_ms / 1000)
 
 
+@functools.lru_cache(maxsize=None)
 def get_dashboard_url(profile: str) -> str:
     key = f"CAFE24_{profile.strip().upper()}_DASHBOARD_URL"
-    v = os.getenv(key, "").strip()
+    v = (CONFIG.profiles.get(profile.strip().upper()) or {}).get("DASHBOARD_URL", "")
     if v:
         return v
 
@@ -174,77 +253,47 @@ def get_dashboard_url(profile: str) -> str:
     raise RuntimeError(f"[{profile}] {key} 를 .env에 추가하세요.")
 
 
-def scrape_by_total_order_amount_right_cell(page) -> str:
+def scrape_by_total_order_amount_right_cell(page, deadline: float) -> str:
     """
     1순위:
-    get_by_role("cell", name="총 주문 금액") 오른쪽 칸(inner_text) 읽기
+    "총 주문 금액" 칸의 오른쪽 칸 텍스트 읽기
+    - page.evaluate 1번으로 브라우저 안에서 DOM을 한 번만 훑음 (칸마다 inner_text 왕복 X)
     + DEBUG 콘솔 출력
     """
     label = page.get_by_role("cell", name="총 주문 금액").first
-    label.wait_for(state="visible", timeout=TIMEOUT)
-
-    # role 기반 방식
-    try:
-        row = label.locator("xpath=ancestor::*[@role='row'][1]")
-        cells = row.get_by_role("cell")
-        if cells.count() == 0:
-            cells = row.get_by_role("gridcell")
-
-        n = cells.count()
-        idx = None
-
-        for i in range(n):
-            t = normalize_text(cells.nth(i).inner_text())
-            if t == "총 주문 금액":
-                idx = i
-                break
-
-        if idx is None or idx + 1 >= n:
-            raise RuntimeError("오른쪽 cell 못 찾음")
-
-        text = normalize_text(cells.nth(idx + 1).inner_text())
-
-        # ✅ 디버그 출력
-        print(f"[DEBUG] 총 주문 금액 오른쪽 raw text = '{text}'")
-
-        if text:
-            return text
-
-    except Exception:
-        pass
-
-    # fallback JS 방식
-    try:
-        text = page.evaluate(
-            """() => {
-              const el = Array.from(document.querySelectorAll('td,th,div,[role="cell"]'))
-                .find(x => (x.innerText || x.textContent || '').trim() === '총 주문 금액');
-              if (!el) return '';
-              const sib = el.nextElementSibling;
-              return sib ? (sib.innerText || sib.textContent || '') : '';
-            }"""
-        )
-
-        text = normalize_text(text)
-
-        # ✅ 디버그 출력
-        print(f"[DEBUG] 총 주문 금액 오른쪽 raw text (fallback) = '{text}'")
-
-        if text:
-            return text
-
-    except Exception:
-        pass
+    label.wait_for(state="visible", timeout=remaining_ms(deadline, TIMEOUT))
+
+    res = page.evaluate(
+        """() => {
+          const norm = (s) => (s || '').replace(/\\s+/g, ' ').trim();
+          const selectors = ['[role="cell"],[role="gridcell"],td,th', 'div'];
+          for (const [i, sel] of selectors.entries()) {
+            const el = Array.from(document.querySelectorAll(sel))
+              .find(x => norm(x.textContent) === '총 주문 금액');
+            const sib = el && el.nextElementSibling;
+            if (sib) return {text: sib.textContent || '', method: i === 0 ? 'cell' : 'div'};
+          }
+          return {text: '', method: ''};
+        }"""
+    )
+
+    text = normalize_text((res or {}).get("text"))
+
+    # ✅ 디버그 출력
+    print(f"[DEBUG] 총 주문 금액 오른쪽 raw text ({(res or {}).get('method')}) = '{text}'")
+
+    if text:
+        return text
 
     raise RuntimeError("'총 주문 금액' 오른쪽 칸 텍스트를 찾지 못했습니다.")
 
 
-def scrape_today_header_below_cell_text(page) -> str:
+def scrape_today_header_below_cell_text(page, deadline: float) -> str:
     """
     2순위 fallback: '오늘' columnheader 아래 칸
     """
     header = page.get_by_role("columnheader", name="오늘").first
-    header.wait_for(state="visible", timeout=TIMEOUT)
+    header.wait_for(state="visible", timeout=remaining_ms(deadline, TIMEOUT))
 
     try:
         header_row = header.locator("xpath=ancestor::*[@role='row'][1]")
@@ -303,67 +352,214 @@ def scrape_today_header_below_cell_text(page) -> str:
 # ---------------------------
 # Public
 # ---------------------------
-def get_current_metrics(profile: str) -> dict:
-    today = datetime.now(KST).date()
+def storage_state_path(profile: str) -> str:
+    return f".cafe24_state_{profile.strip().lower()}.json"
+
+
+def load_storage_state(profile: str):
+    """24시간 이내에 저장된 세션 파일이 있으면 경로 반환, 없으면 None"""
+    path = storage_state_path(profile)
+    try:
+        if time.time() - os.path.getmtime(path) < STORAGE_STATE_MAX_AGE_SEC:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def save_storage_state(context, profile: str) -> None:
+    path = storage_state_path(profile)
+    tmp = f"{path}.tmp"
+    try:
+        context.storage_state(path=tmp)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def is_dashboard_ready(page, timeout: int) -> bool:
+    try:
+        page.get_by_role("cell", name="총 주문 금액").first.wait_for(state="visible", timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+
+def is_restored_session_valid(page, timeout: int) -> bool:
+    """
+    저장된 세션으로 연 대시보드 확인: 대시보드 셀이 보이면 True, 로그인 화면으로 튕겨서 비밀번호 칸이 보이면 False.
+    (둘 중 먼저 보이는 쪽에서 바로 끝나므로 느린 대시보드도 TIMEOUT까지 기다려줌)
+    """
+    dashboard = page.get_by_role("cell", name="총 주문 금액").first
+    login_form = page.locator(LOGIN_PW_SELECTOR).first
+    try:
+        dashboard.or_(login_form).first.wait_for(state="visible", timeout=timeout)
+    except PwTimeoutError:
+        return False
+    return dashboard.is_visible()
+
+
+def launch_browser(p):
     headless = os.getenv("HEADLESS", "false").lower() == "true"
+    return p.chromium.launch(headless=headless, args=CHROMIUM_ARGS)
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=headless)
-        context = browser.new_context()
-        page = context.new_page()
-        page.set_default_timeout(TIMEOUT)
 
-        try:
-            login_cafe24(page, profile=profile)
-            wait_after_login(page, profile=profile)
+def _block_unneeded(route) -> None:
+    req = route.request
+    if req.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_HOSTS_RE.search(req.url):
+        route.abort()
+    else:
+        route.continue_()
+
+
+def new_context(browser, storage_state=None):
+    context = browser.new_context(
+        storage_state=storage_state,
+        extra_http_headers={"Accept-Language": "ko-KR,ko;q=0.9"},
+    )
+    context.route("**/*", _block_unneeded)
+    return context
+
 
-            dashboard_url = get_dashboard_url(profile)
+def _new_page(context):
+    page = context.new_page()
+    page.set_default_timeout(TIMEOUT)
+    return page
+
+
+def _scrape(browser, profile: str) -> dict:
+    """
+    프로필 1개: (저장된 세션 또는 로그인) → 대시보드 → 매출/주문수 파싱.
+    저장된 세션이 있으면 대시보드부터 열어보고, 로그인 화면으로 튕기면
+    그 쿠키가 남지 않은 새 context에서 처음부터 로그인.
+    """
+    today = datetime.now(KST).date()
+    deadline = time.monotonic() + DEADLINE_SEC
+    dashboard_url = get_dashboard_url(profile)
+
+    context = page = None
+    try:
+        # ✅ 저장된 세션이 살아있으면 로그인 생략
+        state = load_storage_state(profile)
+        if state is not None:
+            context = new_context(browser, storage_state=state)
+            page = _new_page(context)
+            page.goto(dashboard_url, wait_until="domcontentloaded", timeout=remaining_ms(deadline, TIMEOUT))
+            if not is_restored_session_valid(page, timeout=remaining_ms(deadline, TIMEOUT)):
+                context.close()
+                context = page = None
+
+        if context is None:
+            context = new_context(browser)
+            page = _new_page(context)
+
+            login_cafe24(page, profile=profile, deadline=deadline)
+            wait_after_login(page, profile=profile)
 
             # ✅ 빠르게: domcontentloaded까지만
-            page.goto(dashboard_url, wait_until="domcontentloaded")
-            time.sleep(4)
+            page.goto(dashboard_url, wait_until="domcontentloaded", timeout=remaining_ms(deadline, TIMEOUT))
 
             # ✅ 핵심 요소가 보일 때까지만 기다림
-            try:
-                page.get_by_role("cell", name="총 주문 금액").first.wait_for(
-                    state="visible", timeout=TIMEOUT
-                )
-            except Exception:
-                pass
-
-            if os.getenv("CAFE24_DEBUG", "false").lower() == "true":
-                os.makedirs("debug", exist_ok=True)
+            is_dashboard_ready(page, timeout=remaining_ms(deadline, TIMEOUT))
+
+        if os.getenv("CAFE24_DEBUG", "false").lower() == "true":
+            os.makedirs("debug", exist_ok=True)
+            with open(f"debug/{profile}_dashboard.html", "w", encoding="utf-8") as f:
+                f.write(page.content())
+            # full_page 스크린샷은 무거워서(~1초) 따로 켰을 때만
+            if os.getenv("CAFE24_DEBUG_SCREENSHOT", "false").lower() == "true":
                 page.screenshot(path=f"debug/{profile}_dashboard.png", full_page=True)
-                with open(f"debug/{profile}_dashboard.html", "w", encoding="utf-8") as f:
-                    f.write(page.content())
 
-            # ✅ 1순위: 총 주문 금액 오른쪽 칸 (+ 디버그 출력이 여기서 발생)
-            try:
-                raw = scrape_by_total_order_amount_right_cell(page)
-            except Exception:
-                # 2순위: 오늘 아래칸
-                raw = scrape_today_header_below_cell_text(page)
+        # ✅ 1순위: 총 주문 금액 오른쪽 칸 (+ 디버그 출력이 여기서 발생)
+        try:
+            raw = scrape_by_total_order_amount_right_cell(page, deadline)
+        except Exception:
+            # 2순위: 오늘 아래칸
+            raw = scrape_today_header_below_cell_text(page, deadline)
 
-            sales, orders = parse_two_numbers(raw)
+        sales, orders = parse_two_numbers(raw)
 
-            return {
-                "status": "ok",
-                "date": today.isoformat(),
-                "sales": int(sales),
-                "orders": int(orders),
-                "raw": raw,
-                "source": "cafe24",
-                "profile": profile,
-            }
+        # ✅ 성공한 세션 저장 (다음 실행에서 로그인 생략용)
+        save_storage_state(context, profile)
 
-        except Exception as e:
+        return {
+            "status": "ok",
+            "date": today.isoformat(),
+            "sales": int(sales),
+            "orders": int(orders),
+            "raw": raw,
+            "source": "cafe24",
+            "profile": profile,
+        }
+
+    except Exception as e:
+        if page is not None:
             save_debug(page, f"{profile}_fail")
-            raise RuntimeError(
-                f"[{profile}] 실패: {e} (debug/{profile}_fail.png, debug/{profile}_fail.html 저장됨)"
-            ) from e
-        finally:
+        raise RuntimeError(
+            f"[{profile}] 실패: {e} (debug/{profile}_fail.png, debug/{profile}_fail.html 저장됨)"
+        ) from e
+    finally:
+        if context is not None:
             context.close()
+
+
+def _scrape_profiles(profiles: list[str]) -> dict[str, dict]:
+    """
+    ✅ Playwright/브라우저는 1번만 띄우고, 프로필마다 새 context(쿠키 분리)로 조회
+    """
+    results = {}
+    with sync_playwright() as p:
+        browser = launch_browser(p)
+        try:
+            for profile in profiles:
+                results[profile] = _scrape(browser, profile)
+        finally:
             browser.close()
+    return results
+
+
+def get_current_metrics_many(profiles: list[str]) -> dict[str, dict]:
+    """
+    여러 프로필 조회.
+    - 기본: 프로필별 스레드에서 병렬 조회 (로그인/페이지 로딩 대기가 겹쳐서 전체 시간 단축)
+      sync Playwright 객체는 스레드 간 공유가 안 되므로 스레드마다 자체 Playwright/브라우저 사용
+    - CAFE24_PARALLEL=false: 브라우저 1개를 공유하며 순차 조회
+    """
+    parallel = os.getenv("CAFE24_PARALLEL", "true").lower() == "true"
+    if not parallel or len(profiles) <= 1:
+        return _scrape_profiles(profiles)
+
+    with ThreadPoolExecutor(max_workers=len(profiles)) as ex:
+        parts = list(ex.map(lambda profile: _scrape_profiles([profile]), profiles))
+
+    results = {}
+    for part in parts:
+        results.update(part)
+    return results
+
+
+def get_current_metrics(profile: str) -> dict:
+    return get_current_metrics_many([profile])[profile]
+
+
+def run_cafe24_all() -> dict:
+    """
+    ✅ brainology + burdenzero 둘 다 조회해서 runner가 쓰는 mapped 형태로 반환
+    (runner에서 import 해서 바로 호출하는 용도)
+    """
+    results = get_current_metrics_many(["brainology", "burdenzero"])
+    r_bio = results["brainology"]
+    r_bz = results["burdenzero"]
+
+    return {
+        "status": "ok",
+        "source": "cafe24",
+        "date": r_bio.get("date") or r_bz.get("date"),
+        "mapped": {
+            "brainology": {"sales": int(r_bio.get("sales", 0)), "orders": int(r_bio.get("orders", 0))},
+            "burdenzero": {"sales": int(r_bz.get("sales", 0)), "orders": int(r_bz.get("orders", 0))},
+        },
+    }
 
 
 # ---------------------------
@@ -378,18 +574,7 @@ def main():
 
     # ✅ 변경: --all이면 둘 다 조회해서 mapped로 출력 (마지막 줄 JSON 1줄)
     if args.all:
-        r_bio = get_current_metrics(profile="brainology")
-        r_bz = get_current_metrics(profile="burdenzero")
-
-        out = {
-            "status": "ok",
-            "source": "cafe24",
-            "date": r_bio.get("date") or r_bz.get("date"),
-            "mapped": {
-                "brainology": {"sales": int(r_bio.get("sales", 0)), "orders": int(r_bio.get("orders", 0))},
-                "burdenzero": {"sales": int(r_bz.get("sales", 0)), "orders": int(r_bz.get("orders", 0))},
-            },
-        }
+        out = run_cafe24_all()
 
         # 기존처럼 사람이 볼 때도 OK
         print(json.dumps(out, ensure_ascii=False) if args.json else out)
@@ -1,22 +1,50 @@
+# connectors/sales/coupang_current.py
+# pip install playwright python-calamine orjson python-dotenv
+
+import io
 import os
 import re
 import time
-import json
 import argparse
+import functools
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Tuple
+from urllib.parse import urlsplit
+from typing import Dict, Optional, Tuple, Union
 
+import orjson
 from dotenv import load_dotenv
-from openpyxl import load_workbook
+from python_calamine import CalamineWorkbook
 from playwright.sync_api import sync_playwright, TimeoutError as PwTimeoutError
 
 load_dotenv()
 KST = timezone(timedelta(hours=9))
 
 MAIN_SELECTOR = "#business-insights-layout__contents__main"
+EXCEL_TRIGGER_SELECTOR = 'text="엑셀 다운로드"'
+EXCEL_PRODUCT_MENU_SELECTOR = 'text="상품별 엑셀 다운로드"'
+DEFAULT_TIMEOUT = 15_000
+
+# ✅ 다운로드 흐름에 필요 없는 리소스는 받지 않음 (JS/XHR/CSS는 그대로 → SPA 정상 렌더)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS_RE = re.compile(
+    r"^https?://([^/?#]*\.)?(doubleclick\.net|googletagmanager\.com|google-analytics\.com|facebook\.net|hotjar\.com"
+    r"|criteo\.(com|net)|mixpanel\.com|segment\.(io|com))(:\d+)?([/?#]|$)"
+)
+
+_INT_RE = re.compile(r"-?\d+")
+
+# ✅ 로그인 세션(쿠키/localStorage) 캐시: 유효하면 로그인 과정 생략
+STORAGE_STATE_FILE = ".coupang_state.json"
+# 세션 확인도 sales 페이지 로드 대기(open_sales_url_with_retry)와 같은 시간까지 기다림 (느린 로딩을 세션 만료로 오판 X)
+SESSION_CHECK_TIMEOUT = 15_000
 
+LOGIN_PW_SELECTOR = "input[type='password'], input[name='password'], input#password"
 
+
+# ✅ .env 값은 실행 중에 안 바뀌므로 첫 조회 결과를 캐시 (URL 템플릿/계정 정보)
+@functools.cache
 def must_env(key: str) -> str:
     v = os.getenv(key)
     if not v:
@@ -58,8 +86,33 @@ def normalize_int(val) -> int:
     if isinstance(val, (int, float)):
         return int(val)
     s = str(val).replace(",", "")
-    nums = re.findall(r"-?\d+", s)
-    return int(nums[0]) if nums else 0
+    if not s:
+        return 0
+    m = _INT_RE.search(s)
+    return int(m.group()) if m else 0
+
+
+def launch_browser(p, headless: bool):
+    """
+    ✅ COUPANG_CDP_URL(예: http://localhost:9222)이 있으면 미리 띄워둔 Chromium
+       (--remote-debugging-port=9222 --headless=new)에 CDP로 붙어서 콜드 스타트 생략.
+       연결 실패/미설정이면 기존처럼 새로 launch.
+    """
+    cdp_url = os.getenv("COUPANG_CDP_URL", "").strip()
+    if cdp_url:
+        try:
+            return p.chromium.connect_over_cdp(cdp_url)
+        except Exception as e:
+            print(f"[WARN] CDP 연결 실패({cdp_url}) → 새 브라우저 실행: {e}")
+    return p.chromium.launch(headless=headless)
+
+
+def _block_unneeded(route) -> None:
+    req = route.request
+    if req.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_HOSTS_RE.search(req.url):
+        route.abort()
+    else:
+        route.continue_()
 
 
 def login_coupang(page) -> None:
@@ -71,13 +124,14 @@ def login_coupang(page) -> None:
 
     scopes = [page] + list(page.frames)
     submitted = False
+    login_page_url = page.url
 
     for scope in scopes:
         try:
             id_loc = scope.locator(
                 "input[type='email'], input[name='username'], input#username, input[name='id'], input[type='text']"
             )
-            pw_loc = scope.locator("input[type='password'], input[name='password'], input#password")
+            pw_loc = scope.locator(LOGIN_PW_SELECTOR)
 
             if id_loc.count() == 0 or pw_loc.count() == 0:
                 continue
@@ -102,11 +156,52 @@ def login_coupang(page) -> None:
         save_debug(page, "coupang_login_form_not_found")
         raise RuntimeError("로그인 폼/버튼을 찾지 못했습니다. debug/coupang_login_form_not_found.* 확인")
 
-    # ✅ 로그인 제출 후: 긴 대기 대신 "짧은 대기 + 메인 셀렉터 확인"으로 넘기는 게 빠름
-    time.sleep(3)
+    # ✅ 로그인 제출 후: 고정 sleep 대신 제출 전 URL에서 벗어나는 순간 바로 진행
+    # (COUPANG_LOGIN_URL에 "login"이 없어도 로그인 요청이 끝나기 전에 다음 goto로 넘어가지 않도록)
+    try:
+        page.wait_for_url(lambda u: u != login_page_url, timeout=10_000)
+    except PwTimeoutError:
+        pass
     wait_quick(page, int(os.getenv("POST_LOGIN_WAIT_MS", "250")))
 
 
+def try_restored_session(page, url: str) -> bool:
+    """
+    저장된 세션으로 sales 페이지가 열리면 True (로그인 생략 가능).
+    로그인 화면으로 튕기면(다른 호스트로 리다이렉트 / 비밀번호 칸 표시) 바로 False,
+    이동 자체가 실패해도 False (호출자가 새 context에서 로그인부터 다시 진행)
+    """
+    main = page.locator(MAIN_SELECTOR).first
+    login_form = page.locator(LOGIN_PW_SELECTOR).first
+    try:
+        page.goto(url, wait_until="domcontentloaded")
+        if urlsplit(page.url).netloc != urlsplit(url).netloc:
+            return False
+        main.or_(login_form).first.wait_for(state="visible", timeout=SESSION_CHECK_TIMEOUT)
+        return main.is_visible()
+    except Exception:
+        return False
+
+
+def save_storage_state(context) -> None:
+    tmp = f"{STORAGE_STATE_FILE}.tmp"
+    try:
+        context.storage_state(path=tmp)
+        os.replace(tmp, STORAGE_STATE_FILE)
+    except Exception:
+        pass
+
+
+def new_context(browser, storage_state: Optional[str] = None):
+    context = browser.new_context(accept_downloads=True, storage_state=storage_state)
+    # ✅ 개별 호출마다 timeout= 넘기지 않도록 기본값 1번만 설정 (페이지 이동은 기존 30초 유지)
+    context.set_default_timeout(DEFAULT_TIMEOUT)
+    context.set_default_navigation_timeout(30_000)
+    # 첫 goto 전에 등록해야 로그인 페이지부터 적용됨
+    context.route("**/*", _block_unneeded)
+    return context
+
+
 def open_sales_url_with_retry(page, url: str, retries: int = 1) -> None:
     attempts = 0
     while True:
@@ -127,29 +222,46 @@ def open_sales_url_with_retry(page, url: str, retries: int = 1) -> None:
             continue
 
 
-def download_product_excel_via_dropdown(page, download_dir: str) -> str:
+def download_product_excel_via_dropdown(page, download_dir: str) -> Tuple[bytes, str]:
     """
     1) '엑셀 다운로드' 드롭다운 트리거 클릭
     2) 메뉴에서 '상품별 엑셀 다운로드' 클릭 (다운로드 발생)
-    """
-    os.makedirs(download_dir, exist_ok=True)
 
-    # MAIN_SELECTOR는 open_sales_url_with_retry에서 이미 기다렸지만, 안전빵으로 짧게 한 번 더
-    page.wait_for_selector(MAIN_SELECTOR, timeout=15_000)
+    반환: (엑셀 bytes, 저장 경로)
+    - 기본은 Playwright 임시 파일을 바로 읽어서 메모리로 넘김 (downloads/에 복사 X → 저장 경로 "")
+    - DEBUG_SAVE_EXCEL=1 이면 download_dir에도 저장
+    """
 
-    trigger = page.get_by_text("엑셀 다운로드", exact=True).first
-    trigger.click(timeout=15_000, force=True)
+    # (MAIN_SELECTOR는 open_sales_url_with_retry에서 이미 기다림)
+    page.locator(EXCEL_TRIGGER_SELECTOR).first.click(force=True)
 
-    menu_item = page.get_by_text("상품별 엑셀 다운로드", exact=True).first
-    menu_item.wait_for(state="visible", timeout=15_000)
+    menu_item = page.locator(EXCEL_PRODUCT_MENU_SELECTOR).first
+    menu_item.wait_for(state="visible")
 
     with page.expect_download(timeout=60_000) as d:
-        menu_item.click(timeout=15_000, force=True)
+        menu_item.click(force=True)
 
     download = d.value
-    path = os.path.join(download_dir, download.suggested_filename)
-    download.save_as(path)
-    return path
+
+    saved_path = ""
+    if os.getenv("DEBUG_SAVE_EXCEL", "") == "1":
+        os.makedirs(download_dir, exist_ok=True)
+        saved_path = os.path.join(download_dir, download.suggested_filename)
+        download.save_as(saved_path)
+
+    try:
+        tmp_path = download.path()
+    except Exception:
+        # 원격(CDP 등) 연결이라 임시 파일 경로를 못 받으면 저장 후 읽음
+        if not saved_path:
+            os.makedirs(download_dir, exist_ok=True)
+            saved_path = os.path.join(download_dir, download.suggested_filename)
+            download.save_as(saved_path)
+        tmp_path = saved_path
+
+    with open(tmp_path, "rb") as f:
+        data = f.read()
+    return data, saved_path
 
 
 @dataclass
@@ -158,8 +270,10 @@ class ProductAgg:
     qty: int = 0
 
 
-def aggregate_from_excel(path: str) -> Tuple[Dict[str, ProductAgg], int, int]:
+def aggregate_from_excel(src: Union[str, bytes]) -> Tuple[Dict[str, ProductAgg], int, int]:
     """
+    src: 엑셀 파일 경로 또는 파일 내용(bytes)
+
     엑셀:
       - C열: 상품명
       - O열: 총 매출
@@ -171,41 +285,67 @@ def aggregate_from_excel(path: str) -> Tuple[Dict[str, ProductAgg], int, int]:
       - 순매출 = O + Q
       - 순수량 = P + R
     """
-    wb = load_workbook(path, data_only=True)
-    ws = wb.active
+    # ✅ calamine(Rust) 리더로 시트 값만 한 번에 읽음 (openpyxl 셀 객체 생성 비용 없음)
+    if isinstance(src, (bytes, bytearray)):
+        wb = CalamineWorkbook.from_filelike(io.BytesIO(src))
+    else:
+        wb = CalamineWorkbook.from_path(src)
+    ws = wb.get_sheet_by_index(0)
+    rows = ws.to_python(skip_empty_area=False)  # A열부터 그대로 (빈 칸은 "")
+
+    agg: Dict[str, ProductAgg] = defaultdict(ProductAgg)
+
+    if not rows:
+        return {}, 0, 0
 
-    agg: Dict[str, ProductAgg] = {}
-    total_sales = 0
-    total_qty = 0
+    # 1행이 헤더면 건너뜀 (C1/O1/P1 중 문자열이 있으면 헤더)
+    first = rows[0]
+    c1, o1, p1 = (first[i] if i < len(first) else None for i in (2, 14, 15))
+    start_row = 2 if any(isinstance(x, str) and x.strip() for x in (c1, o1, p1)) else 1
 
-    c1, o1, p1 = ws["C1"].value, ws["O1"].value, ws["P1"].value
-    start_row = 2 if any(isinstance(x, str) for x in (c1, o1, p1)) else 1
+    for row in rows[start_row - 1:]:
+        if len(row) < 18:
+            row = list(row) + [None] * (18 - len(row))
 
-    for r in range(start_row, ws.max_row + 1):
-        name = ws[f"C{r}"].value
+        # C=2, O=14, P=15, Q=16, R=17
+        name = row[2]
         if name is None:
             continue
         name = str(name).strip()
         if not name:
             continue
 
-        sales_o = normalize_int(ws[f"O{r}"].value)
-        sales_q = normalize_int(ws[f"Q{r}"].value)
-        qty_p = normalize_int(ws[f"P{r}"].value)
-        qty_r = normalize_int(ws[f"R{r}"].value)
+        # 순매출 = O + Q, 순수량 = P + R
+        a = agg[name]
+        a.sales += normalize_int(row[14]) + normalize_int(row[16])
+        a.qty += normalize_int(row[15]) + normalize_int(row[17])
 
-        net_sales = sales_o + sales_q
-        net_qty = qty_p + qty_r
+    # 합계는 상품별 집계에서 한 번에
+    total_sales = sum(a.sales for a in agg.values())
+    total_qty = sum(a.qty for a in agg.values())
 
-        if name not in agg:
-            agg[name] = ProductAgg()
-        agg[name].sales += net_sales
-        agg[name].qty += net_qty
+    return dict(agg), total_sales, total_qty
 
-        total_sales += net_sales
-        total_qty += net_qty
 
-    return agg, total_sales, total_qty
+# 브랜드 분류 키워드 (위에서부터 우선 적용)
+BRAND_KEYWORDS = {
+    "부담제로": ["부담", "부담제로"],
+    "빠디": ["빠디"],
+    "기질 젤리": ["기질", "젤리", "뉴턴", "뉴턴젤리"],
+}
+
+# ✅ 브랜드마다 키워드를 정규식 하나로 묶어 미리 컴파일 (상품명당 브랜드별 검색 1번)
+_BRAND_PATTERNS = [
+    (brand, re.compile("|".join(map(re.escape, keywords))))
+    for brand, keywords in BRAND_KEYWORDS.items()
+]
+
+
+def classify_brand(name: str):
+    for brand, pattern in _BRAND_PATTERNS:
+        if pattern.search(name):
+            return brand
+    return None
 
 
 def aggregate_by_brand(product_agg: Dict[str, ProductAgg]) -> Dict[str, ProductAgg]:
@@ -215,34 +355,28 @@ def aggregate_by_brand(product_agg: Dict[str, ProductAgg]) -> Dict[str, ProductA
       - 빠디
       - 기질 젤리
     """
-    brand_map = {
-        "부담제로": ["부담", "부담제로"],
-        "빠디": ["빠디"],
-        "기질 젤리": ["기질", "젤리", "뉴턴", "뉴턴젤리"],
-    }
-
-    result = {k: ProductAgg() for k in brand_map.keys()}
+    result = {k: ProductAgg() for k in BRAND_KEYWORDS.keys()}
 
     for name, agg in product_agg.items():
-        for brand, keywords in brand_map.items():
-            if any(k in name for k in keywords):
-                result[brand].sales += agg.sales
-                result[brand].qty += agg.qty
-                break
+        brand = classify_brand(name)
+        if brand:
+            result[brand].sales += agg.sales
+            result[brand].qty += agg.qty
 
     return result
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Coupang: product excel download -> net sales/qty -> brand summary")
-    parser.add_argument("--date", help="집계 날짜 (YYYY-MM-DD). 기본: 오늘(KST)", default=None)
-    parser.add_argument("--json", action="store_true", help="러너용: 마지막 줄에 JSON 1줄 출력")
-    args = parser.parse_args()
-
-    headless = os.getenv("HEADLESS", "false").lower() == "true"
+def coupang_collect(date_ymd: str = "", headless: Optional[bool] = None) -> dict:
+    """
+    ✅ runner에서 import 해서 바로 호출하는 용도 (서브프로세스 없이)
+    - date_ymd: YYYY-MM-DD (기본: 오늘 KST)
+    - headless: 기본은 HEADLESS 환경변수
+    """
+    if headless is None:
+        headless = os.getenv("HEADLESS", "false").lower() == "true"
 
-    if args.date:
-        ymd = datetime.strptime(args.date, "%Y-%m-%d").date().strftime("%Y-%m-%d")
+    if date_ymd:
+        ymd = datetime.strptime(date_ymd, "%Y-%m-%d").date().strftime("%Y-%m-%d")
     else:
         # ✅ 변경: 기본값 오늘
         ymd = kst_today_ymd()
@@ -250,21 +384,33 @@ def main():
     url = build_sales_url(ymd)
 
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=headless)
-        context = browser.new_context(accept_downloads=True)
-        page = context.new_page()
+        browser = launch_browser(p, headless)
+        context = page = None
 
         try:
-            login_coupang(page)
+            # ✅ 저장된 세션이 살아있으면 로그인 생략
+            if os.path.exists(STORAGE_STATE_FILE):
+                context = new_context(browser, storage_state=STORAGE_STATE_FILE)
+                page = context.new_page()
+                if not try_restored_session(page, url):
+                    context.close()
+                    context = page = None
+
+            # 세션이 없거나 만료 → 저장된 쿠키가 없는 새 context에서 기존대로 로그인
+            if context is None:
+                context = new_context(browser)
+                page = context.new_page()
+                login_coupang(page)
+                open_sales_url_with_retry(page, url, retries=1)
 
-            open_sales_url_with_retry(page, url, retries=1)
+            save_storage_state(context)
 
             # ============================
             # ✅ 요청 반영(딱 이 부분만 변경)
             # - 엑셀 다운로드 실패 시: sales url 다시 로드 후 1회 재시도
             # ============================
             try:
-                excel_path = download_product_excel_via_dropdown(page, download_dir="downloads")
+                excel_data, excel_path = download_product_excel_via_dropdown(page, download_dir="downloads")
             except Exception as e1:
                 # 1) 페이지를 다시 로드
                 wait_quick(page, 150)
@@ -272,12 +418,12 @@ def main():
 
                 # 2) 엑셀 다운로드 1회 재시도
                 try:
-                    excel_path = download_product_excel_via_dropdown(page, download_dir="downloads")
+                    excel_data, excel_path = download_product_excel_via_dropdown(page, download_dir="downloads")
                 except Exception as e2:
                     raise RuntimeError(f"엑셀 다운로드 재시도까지 실패: first={e1} / second={e2}") from e2
             # ============================
 
-            product_agg, total_sales, total_qty = aggregate_from_excel(excel_path)
+            product_agg, total_sales, total_qty = aggregate_from_excel(excel_data)
             brand_agg = aggregate_by_brand(product_agg)
 
             brand_summary = {brand: {"sales": v.sales, "qty": v.qty} for brand, v in brand_agg.items()}
@@ -297,7 +443,7 @@ def main():
                 },
             }
 
-            payload = {
+            return {
                 "status": "ok",
                 "source": "coupang",
                 "date": ymd,
@@ -309,18 +455,29 @@ def main():
                 "mapped": mapped,
             }
 
-            if args.json:
-                print(json.dumps(payload, ensure_ascii=False))
-            else:
-                print(payload)
-
         except Exception as e:
-            save_debug(page, "coupang_fail")
+            if page is not None:
+                save_debug(page, "coupang_fail")
             raise RuntimeError(f"실패: {e} (debug/coupang_fail.* 저장됨)") from e
         finally:
-            context.close()
+            if context is not None:
+                context.close()
             browser.close()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Coupang: product excel download -> net sales/qty -> brand summary")
+    parser.add_argument("--date", help="집계 날짜 (YYYY-MM-DD). 기본: 오늘(KST)", default=None)
+    parser.add_argument("--json", action="store_true", help="러너용: 마지막 줄에 JSON 1줄 출력")
+    args = parser.parse_args()
+
+    payload = coupang_collect(args.date or "")
+
+    if args.json:
+        print(orjson.dumps(payload).decode())
+    else:
+        print(payload)
+
+
 if __name__ == "__main__":
     main()
@@ -1,14 +1,16 @@
 # connectors/sales/naver_current.py
-# pip install requests bcrypt pybase64 python-dotenv
+# pip install requests bcrypt pybase64 orjson python-dotenv
 
 import os
 import json
 import time
 import argparse
-from collections import Counter
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 
+import orjson
 import requests
 import bcrypt
 import pybase64
@@ -21,9 +23,22 @@ PRODUCT_ORDERS_URL = f"{API_BASE}/v1/pay-order/seller/product-orders"
 TOKEN_CACHE_FILE = ".naver_token_cache.json"
 KST = timezone(timedelta(hours=9))
 
+# row에 content/order/productOrder가 없을 때 쓰는 공용 빈 dict (매 row마다 {} 생성 방지)
+EMPTY = MappingProxyType({})
+
 # ✅ runner(run_current_to_gsheet.py)가 기대하는 브랜드 키
 RUNNER_BRANDS = ("burdenzero", "brainology")
 
+# ✅ 같은 호스트로 여러 번 호출하므로 Session 하나로 keep-alive 재사용
+SESSION = requests.Session()
+
+# 전체 페이지 수를 알 수 있을 때 2페이지부터 동시에 받는 개수 (rate limit 고려)
+PAGE_FETCH_CONCURRENCY = 8
+
+# 429(rate limit) 응답 재시도 (동시 페이지 조회 시 순간적으로 걸릴 수 있음)
+RETRY_TOTAL = 3
+RETRY_BACKOFF_SEC = 0.5
+
 
 # ---------------------------
 # Time helpers (Asia/Seoul)
@@ -100,13 +115,14 @@ def issue_token_self(client_id: str, client_secret: str) -> dict:
     }
 
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    r = requests.post(TOKEN_URL, data=data, headers=headers, timeout=30)
+    r = SESSION.post(TOKEN_URL, data=data, headers=headers, timeout=30)
     if r.status_code != 200:
         raise RuntimeError(f"[TOKEN ERROR] {r.status_code} {r.text}")
 
     payload = r.json()
     expires_in = int(payload.get("expires_in", 0) or 0)
-    payload["expires_at"] = int(time.time()) + max(expires_in, 0)
+    payload["issued_at"] = int(time.time())
+    payload["expires_at"] = payload["issued_at"] + max(expires_in, 0)
     return payload
 
 
@@ -121,14 +137,36 @@ def get_access_token(client_id: str, client_secret: str, force_refresh: bool = F
     return payload["access_token"]
 
 
+def get_access_token_from_env(force_refresh: bool = False) -> str:
+    """
+    .env의 NAVER_COMMERCE_CLIENT_ID/SECRET으로 토큰 조회 (캐시 우선)
+    - runner가 1번만 호출해서 NAVER_ACCESS_TOKEN으로 넘겨주면 서브프로세스는 캐시 I/O/bcrypt 생략
+    """
+    load_dotenv()
+
+    client_id = (os.getenv("NAVER_COMMERCE_CLIENT_ID") or "").strip()
+    client_secret = (os.getenv("NAVER_COMMERCE_CLIENT_SECRET") or "").strip()
+    if not client_id or not client_secret:
+        raise ValueError("필수 .env: NAVER_COMMERCE_CLIENT_ID, NAVER_COMMERCE_CLIENT_SECRET")
+
+    return get_access_token(client_id, client_secret, force_refresh=force_refresh)
+
+
 # ---------------------------
 # Orders API
 # ---------------------------
 def http_get_json(url: str, headers: dict, params: dict) -> dict:
-    r = requests.get(url, headers=headers, params=params, timeout=30)
+    for attempt in range(RETRY_TOTAL + 1):
+        r = SESSION.get(url, headers=headers, params=params, timeout=30)
+        if r.status_code != 429 or attempt == RETRY_TOTAL:
+            break
+        # ✅ rate limit: Retry-After가 있으면 그만큼, 없으면 지수 백오프 후 재시도
+        retry_after = safe_int(r.headers.get("Retry-After"))
+        time.sleep(retry_after or RETRY_BACKOFF_SEC * (2 ** attempt))
+
     if r.status_code != 200:
         raise RuntimeError(f"[API ERROR] {r.status_code} {r.text}")
-    return r.json()
+    return orjson.loads(r.content)
 
 
 def iter_product_orders(
@@ -141,12 +179,13 @@ def iter_product_orders(
     """
     GET /v1/pay-order/seller/product-orders
     - rangeType=PAYED_DATETIME (결제일시 기준)
-    - pagination: data.pagination.hasNext 기반 순회
+    - pagination: 1페이지 응답에 totalPages/totalElements가 있으면 그 페이지까지 동시에 조회,
+      이후(또는 전체 페이지 수를 모르면) data.pagination.hasNext 기반 순차 순회
+    - row는 항상 페이지 순서대로 yield
     """
     headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
-    page = 1
 
-    while True:
+    def fetch_page(page: int) -> dict:
         params = {
             "from": from_iso,
             "to": to_iso,
@@ -160,17 +199,36 @@ def iter_product_orders(
             params["productOrderStatuses"] = ",".join(statuses)
 
         resp = http_get_json(PRODUCT_ORDERS_URL, headers=headers, params=params)
+        return resp.get("data") or {}
 
-        data = resp.get("data") or {}
-        contents = data.get("contents") or []
-        pagination = data.get("pagination") or {}
-        has_next = bool(pagination.get("hasNext"))
+    data = fetch_page(1)
+    contents = data.get("contents") or []
+    yield from contents
 
-        for row in contents:
-            yield row
+    pagination = data.get("pagination") or {}
+    if not pagination.get("hasNext"):
+        return
 
-        if not has_next:
-            break
+    total_pages = safe_int(pagination.get("totalPages"))
+    if not total_pages and pagination.get("totalElements") is not None:
+        # ✅ 요청한 size가 아니라 서버가 실제 적용한 페이지 크기로 계산 (서버가 size를 줄였을 때 누락 방지)
+        server_size = safe_int(pagination.get("size")) or len(contents) or page_size
+        total_pages = -(-safe_int(pagination.get("totalElements")) // server_size)
+
+    # ✅ 전체 페이지 수를 알면 2..N 페이지를 동시에 조회 (map은 순서 유지)
+    page = 2
+    last = data
+    if total_pages > 1:
+        with ThreadPoolExecutor(max_workers=min(PAGE_FETCH_CONCURRENCY, total_pages - 1)) as ex:
+            for page_data in ex.map(fetch_page, range(2, total_pages + 1)):
+                yield from page_data.get("contents") or []
+                last = page_data
+        page = total_pages + 1
+
+    # 전체 페이지 수를 모르거나, 조회 중에 새 결제가 들어와 마지막 페이지에 hasNext가 있으면 순차로 이어서 조회
+    while (last.get("pagination") or {}).get("hasNext"):
+        last = fetch_page(page)
+        yield from last.get("contents") or []
         page += 1
 
 
@@ -193,7 +251,12 @@ def safe_int(v) -> int:
 # ---------------------------
 # Public API (for runner)
 # ---------------------------
-def get_daily_metrics(target_date: datetime.date, force_token: bool = False, raw: bool = False) -> Dict[str, Any]:
+def get_daily_metrics(
+    target_date: datetime.date,
+    force_token: bool = False,
+    raw: bool = False,
+    access_token: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Returns a dict that runner can consume:
       {
@@ -206,24 +269,19 @@ def get_daily_metrics(target_date: datetime.date, force_token: bool = False, raw
         "status_counter": {...},
         "mapped": { ... }           # ✅ runner 호환용
       }
+    access_token을 주면(예: runner가 미리 발급) 토큰 조회를 생략
     """
-    load_dotenv()
-
-    client_id = (os.getenv("NAVER_COMMERCE_CLIENT_ID") or "").strip()
-    client_secret = (os.getenv("NAVER_COMMERCE_CLIENT_SECRET") or "").strip()
-    if not client_id or not client_secret:
-        raise ValueError("필수 .env: NAVER_COMMERCE_CLIENT_ID, NAVER_COMMERCE_CLIENT_SECRET")
-
     from_iso, to_iso = kst_day_range(target_date)
 
     # ✅ 변경: 상태 필터 제거 => 오늘 범위에 잡히는 주문을 전부 합산
     statuses: list[str] = []
 
-    access_token = get_access_token(client_id, client_secret, force_refresh=force_token)
+    if not access_token or force_token:
+        access_token = get_access_token_from_env(force_refresh=force_token)
 
     order_ids = set()
     product_order_count = 0
-    status_counter = Counter()
+    status_counter: Dict[str, int] = {}
 
     # ✅ 매출 정의(기존 유지): initialProductAmount - initialProductDiscountAmount
     sales_amount = 0
@@ -231,22 +289,32 @@ def get_daily_metrics(target_date: datetime.date, force_token: bool = False, raw
     sample_printed = 0
 
     for row in iter_product_orders(access_token, from_iso, to_iso, statuses=statuses, page_size=300):
-        content = row.get("content") or {}
-        order = content.get("order") or {}
-        product_order = content.get("productOrder") or {}
+        content = row.get("content") or EMPTY
+        order = content.get("order") or EMPTY
+        product_order = content.get("productOrder") or EMPTY
 
         order_id = order.get("orderId")
         if order_id:
-            order_ids.add(str(order_id))
+            # ✅ 숫자 orderId는 int로 저장 (문자열보다 set 메모리 적게 씀)
+            try:
+                order_ids.add(int(order_id))
+            except (TypeError, ValueError):
+                order_ids.add(str(order_id))
 
         status = product_order.get("productOrderStatus")
         if status:
-            status_counter[str(status)] += 1
-
-        initial_product_amount = safe_int(product_order.get("initialProductAmount"))
-        initial_product_discount_amount = safe_int(product_order.get("initialProductDiscountAmount"))
-
-        sales_amount += (initial_product_amount - initial_product_discount_amount)
+            status = str(status)
+            status_counter[status] = status_counter.get(status, 0) + 1
+
+        # ✅ 대부분 이미 int라서 그 경우는 safe_int 분기 생략
+        amount = product_order.get("initialProductAmount")
+        discount = product_order.get("initialProductDiscountAmount")
+        if type(amount) is not int:
+            amount = safe_int(amount)
+        if type(discount) is not int:
+            discount = safe_int(discount)
+
+        sales_amount += (amount - discount)
         product_order_count += 1
 
         if raw and sample_printed < 3:
@@ -270,7 +338,7 @@ def get_daily_metrics(target_date: datetime.date, force_token: bool = False, raw
         "sales": total_sales,
         "orders": total_orders,  # 유니크 orderId 기준
         "product_order_count": int(product_order_count),
-        "status_counter": dict(status_counter) if status_counter else {},
+        "status_counter": status_counter,
         "from": from_iso,
         "to": to_iso,
         "mapped": mapped,
@@ -289,6 +357,11 @@ def main():
         action="store_true",
         help="러너용: 마지막 줄에 JSON 1줄로 결과 출력",
     )
+    parser.add_argument(
+        "--token",
+        default=os.getenv("NAVER_ACCESS_TOKEN", ""),
+        help="이미 발급된 access token 사용 (기본: NAVER_ACCESS_TOKEN 환경변수, 없으면 캐시/발급)",
+    )
     args = parser.parse_args()
 
     if args.date:
@@ -297,10 +370,15 @@ def main():
         # ✅ 기본값: 오늘(KST)
         target_date = now_kst().date()
 
-    result = get_daily_metrics(target_date=target_date, force_token=args.force_token, raw=args.raw)
+    result = get_daily_metrics(
+        target_date=target_date,
+        force_token=args.force_token,
+        raw=args.raw,
+        access_token=(args.token or "").strip() or None,
+    )
 
     if args.json:
-        print(json.dumps(result, ensure_ascii=False))
+        print(orjson.dumps(result).decode())
         return
 
     print("\n==============================")
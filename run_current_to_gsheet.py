@@ -1,9 +1,20 @@
+# run_current_to_gsheet.py
+# pip install requests orjson python-dotenv google-auth google-api-python-client
+
 import os
+import sys
 import json
+import time
+import re
+import bisect
+import argparse
 import subprocess
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, Tuple, List
 
+import orjson
 import requests  # ✅ 추가(슬랙 웹훅)
 
 from dotenv import load_dotenv
@@ -23,6 +34,17 @@ tempfile.tempdir = r"C:\temp"
 # ✅ 해결 1: Playwright temp 경로를 안정적으로 고정 (서브프로세스에도 동일 적용)
 SAFE_TEMP_DIR = r"C:\Temp"
 
+# ✅ in-process로 부르는 커넥터도 ✅/❌ 등을 출력하므로 Windows 콘솔 인코딩 이슈 방지
+if hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+
+# ✅ 소스별 결과 캐시: 같은 슬롯에서 다시 돌릴 때(시트/슬랙 실패 후 재실행 등) 스크래핑 생략
+SOURCE_CACHE_DIR = ".cache"
+SOURCE_CACHE_MAX_AGE_SEC = 600
+
+# ✅ RUNNER_SUBPROCESS=true면 예전처럼 각 스크립트를 서브프로세스로 실행 (fallback)
+USE_SUBPROCESS = os.getenv("RUNNER_SUBPROCESS", "false").lower() == "true"
+
 KST = timezone(timedelta(hours=9))
 
 SPREADSHEET_ID = "1DeSRVN4pWf6rnp1v_FeePUYe1ngjwyq_znXZUzl_kbM"
@@ -66,19 +88,6 @@ def today_ymd_kst() -> str:
     return now_kst().date().strftime("%Y-%m-%d")
 
 
-def pick_slot(dt: datetime) -> Optional[Tuple[str, str]]:
-    """
-    현재 시간이 슬롯(±SLOT_TOLERANCE_MINUTES분)에 속하면 (slot_label, start_col_letter) 반환
-    아니면 None
-    """
-    tolerance_sec = SLOT_TOLERANCE_MINUTES * 60
-    for label, hh, mm, col in SLOTS:
-        center = dt.replace(hour=hh, minute=mm, second=0, microsecond=0)
-        if abs((dt - center).total_seconds()) <= tolerance_sec:
-            return (label, col)
-    return None
-
-
 def col_to_index(col: str) -> int:
     """A=1, B=2 ..."""
     col = col.strip().upper()
@@ -97,7 +106,37 @@ def index_to_col(n: int) -> str:
     return s
 
 
-def run_script_json(py_path: str, args: List[str]) -> Dict[str, Any]:
+# ✅ 슬롯 테이블은 import 시 1번만 계산
+# - _SLOT_CENTERS: (자정 기준 초, label, 시작열) 정렬 리스트 → bisect로 가장 가까운 슬롯 검색
+# - SLOT_COL_RANGES: 시작열 → (시작 index, 끝 index, 끝열)
+_SLOT_CENTERS = sorted((hh * 3600 + mm * 60, label, col) for label, hh, mm, col in SLOTS)
+_SLOT_CENTER_SECS = [c[0] for c in _SLOT_CENTERS]
+SLOT_COL_RANGES: Dict[str, Tuple[int, int, str]] = {}
+for _label, _hh, _mm, _col in SLOTS:
+    _start = col_to_index(_col)
+    _end = _start + len(FIELDS) - 1
+    SLOT_COL_RANGES[_col] = (_start, _end, index_to_col(_end))
+
+
+def pick_slot(dt: datetime) -> Optional[Tuple[str, str]]:
+    """
+    현재 시간이 슬롯(±SLOT_TOLERANCE_MINUTES분)에 속하면 (slot_label, start_col_letter) 반환
+    아니면 None
+    """
+    tolerance_sec = SLOT_TOLERANCE_MINUTES * 60
+    sec = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1_000_000
+
+    # 가장 가까운 슬롯은 bisect 위치의 양옆 중 하나
+    i = bisect.bisect_left(_SLOT_CENTER_SECS, sec)
+    for j in (i - 1, i):
+        if 0 <= j < len(_SLOT_CENTERS):
+            center, label, col = _SLOT_CENTERS[j]
+            if abs(sec - center) <= tolerance_sec:
+                return (label, col)
+    return None
+
+
+def run_script_json(py_path: str, args: List[str], extra_env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     스크립트를 실행하고 stdout의 마지막 JSON 라인을 파싱
 
@@ -119,6 +158,9 @@ def run_script_json(py_path: str, args: List[str]) -> Dict[str, Any]:
     env["PYTHONUTF8"] = "1"
     env["PYTHONIOENCODING"] = "utf-8"
 
+    if extra_env:
+        env.update(extra_env)
+
     cmd = ["python", py_path] + args
     p = subprocess.run(
         cmd,
@@ -139,13 +181,105 @@ def run_script_json(py_path: str, args: List[str]) -> Dict[str, Any]:
         raise RuntimeError(f"[SCRIPT NO OUTPUT] {py_path}")
     last = lines[-1]
     try:
-        return json.loads(last)
+        return orjson.loads(last)
     except Exception:
         raise RuntimeError(
             f"[SCRIPT JSON PARSE FAIL] {py_path}\nlast_line={last}\nFULL_STDOUT:\n{p.stdout}"
         )
 
 
+def collect_naver() -> Dict[str, Any]:
+    from connectors.sales.naver_current import (
+        get_access_token_from_env as get_naver_access_token,
+        get_daily_metrics as naver_get_daily_metrics,
+    )
+
+    # ✅ 네이버 토큰은 runner에서 1번만 받아서 전달
+    naver_token = get_naver_access_token()
+    if USE_SUBPROCESS:
+        # 서브프로세스에는 환경변수로 전달 (argv에 토큰 노출 X)
+        return run_script_json(
+            "connectors/sales/naver_current.py", ["--json"], {"NAVER_ACCESS_TOKEN": naver_token}
+        )
+    return naver_get_daily_metrics(now_kst().date(), access_token=naver_token)
+
+
+def source_cache_path(source: str, ymd: str, slot_label: str) -> str:
+    # Windows 파일명에 ':' 불가 → "10:00" → "1000"
+    return os.path.join(SOURCE_CACHE_DIR, f"{source}-{ymd}-{slot_label.replace(':', '')}.json")
+
+
+def load_source_cache(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        if time.time() - os.path.getmtime(path) >= SOURCE_CACHE_MAX_AGE_SEC:
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except Exception:
+        return None
+
+
+def save_source_cache(path: str, data: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def cached_collect(source: str, fn, ymd: str, slot_label: str, use_cache: bool) -> Dict[str, Any]:
+    path = source_cache_path(source, ymd, slot_label)
+    if use_cache:
+        cached = load_source_cache(path)
+        if cached is not None:
+            print(f"[CACHE] {source} ({path})")
+            return cached
+
+    res = fn()
+    save_source_cache(path, res)
+    return res
+
+
+def collect_all_sources(ymd: str, slot_label: str, use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    4개 소스(cafe24/coupang/naver/meta)를 동시에 조회 (모두 I/O 대기라 병렬이면 max(t)만 걸림)
+    - 각 소스는 서로 다른 debug/다운로드/토큰캐시 파일을 써서 충돌 없음
+    - 같은 날짜/슬롯의 최근(SOURCE_CACHE_MAX_AGE_SEC 이내) 결과가 있으면 재사용
+    """
+    if USE_SUBPROCESS:
+        jobs = {
+            "cafe24": partial(run_script_json, "connectors/sales/cafe24_current.py", ["--all", "--json"]),
+            "coupang": partial(run_script_json, "connectors/sales/coupang_current.py", ["--json"]),
+            "naver": collect_naver,
+            "meta": partial(run_script_json, "connectors/meta/meta_ads_current.py", ["--json"]),
+        }
+    else:
+        # ✅ 커넥터들은 같은 프로세스에서 직접 호출 (여기서 import → 서브프로세스 모드에선 playwright 등을 안 불러옴)
+        from connectors.meta.meta_ads_current import run_meta
+        from connectors.sales.cafe24_current import run_cafe24_all
+        from connectors.sales.coupang_current import coupang_collect
+
+        jobs = {
+            "cafe24": run_cafe24_all,
+            "coupang": coupang_collect,
+            "naver": collect_naver,
+            "meta": run_meta,
+        }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        futures = {
+            ex.submit(cached_collect, name, fn, ymd, slot_label, use_cache): name
+            for name, fn in jobs.items()
+        }
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+    return results
+
+
 def get_sheets_service():
     """
     Service Account JSON을 env에서 받는 방식 2개 지원:
@@ -170,27 +304,24 @@ def get_sheets_service():
     return build("sheets", "v4", credentials=creds)
 
 
-def get_sheet_values(svc, sheet_name: str, a1: str) -> List[List[Any]]:
-    return (
+def batch_get_values(svc, ranges: List[str]) -> List[List[List[Any]]]:
+    """여러 range를 values.batchGet 1번으로 조회 (요청한 ranges 순서대로 반환)"""
+    resp = (
         svc.spreadsheets()
         .values()
-        .get(spreadsheetId=SPREADSHEET_ID, range=f"{sheet_name}!{a1}")
+        .batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges)
         .execute()
-        .get("values", [])
     )
+    return [vr.get("values", []) for vr in resp.get("valueRanges", [])]
 
 
-def update_sheet_values(svc, sheet_name: str, a1: str, values: List[List[Any]]):
-    body = {"values": values}
+def batch_update_values(svc, data: List[Dict[str, Any]]):
+    """[{"range": "시트!A1:B1", "values": [[...]]}, ...] 를 values.batchUpdate 1번으로 기록"""
+    body = {"valueInputOption": "USER_ENTERED", "data": data}
     return (
         svc.spreadsheets()
         .values()
-        .update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{sheet_name}!{a1}",
-            valueInputOption="USER_ENTERED",
-            body=body,
-        )
+        .batchUpdate(spreadsheetId=SPREADSHEET_ID, body=body)
         .execute()
     )
 
@@ -211,6 +342,9 @@ def append_sheet_values(svc, sheet_name: str, a1: str, values: List[List[Any]]):
     )
 
 
+_UPDATED_ROW_RE = re.compile(r"![A-Z]+(\d+)")
+
+
 # ✅✅✅ 여기부터 수정(핵심): "마지막 행이 오늘이면 재사용" + 날짜 문자열 정규화
 def _normalize_ymd(value: Any) -> str:
     """
@@ -252,35 +386,42 @@ def _normalize_ymd(value: Any) -> str:
     return s
 
 
-def find_or_create_today_row(svc, sheet_name: str, ymd: str) -> int:
+def find_today_rows(svc, sheet_names: List[str], ymd: str) -> Dict[str, int]:
     """
     ✅ 변경 요구사항 반영:
-    - A열의 "마지막으로 채워진 행"이 오늘(ymd)이면 그 행(row index)을 반환
-    - 아니면 맨 아래에 오늘 날짜를 추가하고 그 row 반환
+    - A열의 "마지막으로 채워진 행"이 오늘(ymd)이면 그 행(row index)을 사용
+    - 아니면 오늘 날짜를 append(INSERT_ROWS)로 새 행에 추가 (시트 행이 꽉 차도 행이 늘어남, 하루에 시트당 1번)
+    - 모든 시트의 A열을 batchGet 1번으로 조회
+
+    반환: {sheet_name: row_idx}
 
     (기존: A열 전체에서 오늘을 찾고 없으면 append → 날짜 포맷/공백 문제로 매번 append 될 수 있었음)
     """
-    colA = get_sheet_values(svc, sheet_name, "A:A")
-
-    # 마지막으로 값이 있는 행 찾기 (끝에 빈 행들이 있어도 안전)
-    last_filled_row_idx = 0
-    last_value = ""
-    for i in range(len(colA), 0, -1):  # 1-based row index
-        row = colA[i - 1]
-        if row and str(row[0]).strip():
-            last_filled_row_idx = i
-            last_value = row[0]
-            break
-
-    # 마지막 행이 오늘이면 그 행 재사용
-    if last_filled_row_idx > 0:
-        if _normalize_ymd(last_value) == ymd:
-            return last_filled_row_idx
-
-    # 아니면 새 행 append
-    append_sheet_values(svc, sheet_name, "A:A", [[ymd]])
-    colA2 = get_sheet_values(svc, sheet_name, "A:A")
-    return len(colA2) if colA2 else 1
+    cols = batch_get_values(svc, [f"{name}!A:A" for name in sheet_names])
+
+    rows: Dict[str, int] = {}
+    for sheet_name, colA in zip(sheet_names, cols):
+        # 마지막으로 값이 있는 행 찾기 (끝에 빈 행들이 있어도 안전)
+        last_filled_row_idx = 0
+        last_value = ""
+        for i in range(len(colA), 0, -1):  # 1-based row index
+            row = colA[i - 1]
+            if row and str(row[0]).strip():
+                last_filled_row_idx = i
+                last_value = row[0]
+                break
+
+        # 마지막 행이 오늘이면 그 행 재사용
+        if last_filled_row_idx > 0 and _normalize_ymd(last_value) == ymd:
+            rows[sheet_name] = last_filled_row_idx
+            continue
+
+        # 아니면 새 행 append → 응답의 updatedRange("시트!A123")에서 행 번호를 바로 얻음 (A열 재조회 X)
+        resp = append_sheet_values(svc, sheet_name, "A:A", [[ymd]])
+        updated_range = (resp.get("updates") or {}).get("updatedRange") or ""
+        m = _UPDATED_ROW_RE.search(updated_range)
+        rows[sheet_name] = int(m.group(1)) if m else last_filled_row_idx + 1
+    return rows
 # ✅✅✅ 수정 끝
 
 
@@ -362,6 +503,10 @@ def compute_roas_cpa_for_brand(brand: str, cafe24_res, coupang_res, naver_res, m
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-cache", action="store_true", help="소스별 결과 캐시 무시하고 전부 새로 조회")
+    args = parser.parse_args()
+
     # 1) 현재 시간이 슬롯 범위에 속하는지 확인
     now = now_kst()
     picked = pick_slot(now)
@@ -376,28 +521,35 @@ def main():
     print(f"[INFO] slot={slot_label} start_col={start_col} date={ymd}")
 
     # 2) 각 current 스크립트 실행해서 값 가져오기
-    cafe24_res = run_script_json("connectors/sales/cafe24_current.py", ["--all", "--json"])
-    coupang_res = run_script_json("connectors/sales/coupang_current.py", ["--json"])
-    naver_res = run_script_json("connectors/sales/naver_current.py", ["--json"])
-    meta_res = run_script_json("connectors/meta/meta_ads_current.py", ["--json"])
+    sources = collect_all_sources(ymd, slot_label, use_cache=not args.no_cache)
+    cafe24_res = sources["cafe24"]
+    coupang_res = sources["coupang"]
+    naver_res = sources["naver"]
+    meta_res = sources["meta"]
 
     # 3) 구글시트 연결
     svc = get_sheets_service()
 
     # 4) 각 브랜드별로 해당 시트에 기록
-    start_idx = col_to_index(start_col)
-    end_idx = start_idx + len(FIELDS) - 1
-    end_col = index_to_col(end_idx)
+    _, _, end_col = SLOT_COL_RANGES[start_col]
+
+    # ✅ A열 조회 1번(batchGet) + (새 날짜면 시트당 append 1번) + 값 기록 1번(batchUpdate)
+    today_rows = find_today_rows(svc, list(BRAND_SHEETS.values()), ymd)
 
+    data = []
+    logs = []
     for brand, sheet_name in BRAND_SHEETS.items():
-        row_idx = find_or_create_today_row(svc, sheet_name, ymd)
+        row_idx = today_rows[sheet_name]
 
         values = build_row_payload(brand, cafe24_res, coupang_res, naver_res, meta_res)
 
         range_a1 = f"{start_col}{row_idx}:{end_col}{row_idx}"
-        update_sheet_values(svc, sheet_name, range_a1, [values])
+        data.append({"range": f"{sheet_name}!{range_a1}", "values": [values]})
+        logs.append(f"[OK] {sheet_name} row={row_idx} range={range_a1} values={values}")
 
-        print(f"[OK] {sheet_name} row={row_idx} range={range_a1} values={values}")
+    batch_update_values(svc, data)
+    for line in logs:
+        print(line)
 
     # ✅ 시트 기록 후 슬랙 발송(요청 반영된 ROAS/CPA)
     bz = compute_roas_cpa_for_brand("burdenzero", cafe24_res, coupang_res, naver_res, meta_res)